@@ -10,11 +10,17 @@ sys.path.append(os.path.join(os.getcwd(), 'src'))
 # except Exception:
 #     CsvFormatter = None
 from fmt import CsvFormatter
+from parallel_fmt import SHARED_MEMORY_SUPPORTED, format_parallel
 
 arg_parser = argparse.ArgumentParser()
 arg_parser.add_argument('-m', '--format-map')
+arg_parser.add_argument('-j', '--jobs', type=int, help='format the rows using this many worker processes')
 if __name__ == '__main__':
     args = arg_parser.parse_args()
+    if args.jobs is not None and args.jobs < 1:
+        print('Error! The number of jobs must be at least 1. Aborting', file=sys.stderr)
+        sys.exit(1)
+
     the_map = {}
     if args.format_map:
         try:
@@ -40,6 +46,14 @@ if __name__ == '__main__':
     formatted_rows.writeheader()
     unformatted_rows = csv.DictWriter(sys.stderr, rows.fieldnames)
     unformatted_rows.writeheader()
+    # The formatted rows are written to the binary stdout, which only matches the text stdout
+    # used for the header and the serial path where lines are not translated.
+    if csv_formatter and args.jobs and SHARED_MEMORY_SUPPORTED:
+        sys.stdout.flush()
+        for row in format_parallel(csv_formatter, rows, rows.fieldnames, sys.stdout.buffer, args.jobs, encoding=sys.stdout.encoding, errors=sys.stdout.errors):
+            unformatted_rows.writerow(row)
+        sys.exit(0)
+
     for row in rows:
         if csv_formatter:
             result = csv_formatter.format(row)
@@ -0,0 +1,153 @@
+# Formats CSV rows in chunks across worker processes and hands the output back through shared memory.
+
+import collections
+import csv
+import io
+import itertools
+import multiprocessing
+import os
+from multiprocessing import resource_tracker, shared_memory
+
+DEFAULT_CHUNK_SIZE = 1000
+
+# A worker closes its handle on a segment before the parent attaches to it.  POSIX keeps the
+# segment until it is unlinked, but on Windows it is destroyed with its last handle, so the
+# rows are formatted in this process on other platforms.
+SHARED_MEMORY_SUPPORTED = os.name == 'posix'
+
+_worker_formatter = None
+
+def _init_worker(csv_formatter):
+    """
+    Stores the formatter in the worker process so it is only pickled once per worker.
+    """
+    global _worker_formatter
+    _worker_formatter = csv_formatter
+
+def _encode_chunk(csv_formatter, fieldnames, rows, encoding, errors):
+    """
+    Formats a chunk of rows and returns the formatted rows encoded as CSV, along with the
+    indices within the chunk of the rows that could not be formatted.  The errors parameter is
+    the encoding error handler, as for str.encode.
+    """
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames)
+    rejects = []
+    for index, row in enumerate(rows):
+        failed_formats, new_record = csv_formatter.format(row)
+        if failed_formats:
+            rejects.append(index)
+        else:
+            writer.writerow(new_record)
+    return buffer.getvalue().encode(encoding, errors), rejects
+
+def _format_chunk(task):
+    """
+    Formats a chunk of rows in a worker process and places the encoded rows in a shared memory
+    segment.  Returns the segment name, the number of bytes used and the rejected indices.
+    """
+    fieldnames, rows, encoding, errors = task
+    data, rejects = _encode_chunk(_worker_formatter, fieldnames, rows, encoding, errors)
+    # A shared memory segment may not be empty, so reserve at least one byte.
+    segment = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+    segment.buf[:len(data)] = data
+    segment.close()
+    return segment.name, len(data), rejects
+
+def _read_chunks(rows, chunk_size):
+    """
+    Splits the rows into lists of chunk_size rows.
+    """
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def _write_segment(name, size, formatted_file):
+    """
+    Writes the used part of the segment to formatted_file and removes the segment.
+    """
+    segment = shared_memory.SharedMemory(name=name)
+    try:
+        with segment.buf[:size] as view:
+            formatted_file.write(view)
+    finally:
+        segment.close()
+        segment.unlink()
+
+def _write_result(chunk, result, formatted_file):
+    """
+    Waits for a chunk to be formatted, writes its segment and yields its rejected rows.
+    """
+    name, size, rejects = result.get()
+    _write_segment(name, size, formatted_file)
+    for index in rejects:
+        yield chunk[index]
+
+def _unlink_segment(name):
+    """
+    Removes a segment that will not be written.
+    """
+    segment = shared_memory.SharedMemory(name=name)
+    segment.close()
+    segment.unlink()
+
+def _format_in_process(csv_formatter, rows, fieldnames, formatted_file, chunk_size, encoding, errors):
+    """
+    Formats the chunks in this process, for platforms without shared memory support.
+    """
+    for chunk in _read_chunks(rows, chunk_size):
+        data, rejects = _encode_chunk(csv_formatter, fieldnames, chunk, encoding, errors)
+        formatted_file.write(data)
+        for index in rejects:
+            yield chunk[index]
+
+def _format_in_pool(csv_formatter, rows, fieldnames, formatted_file, jobs, chunk_size, encoding, errors):
+    """
+    Formats the chunks in a pool of worker processes and writes them from shared memory.
+    """
+    # Start the resource tracker before the workers are created so that they share it with
+    # this process rather than each starting one that would clean up the segments on exit.
+    resource_tracker.ensure_running()
+    # At most two chunks per worker are submitted ahead of the writer, which bounds both the
+    # rows read from the input and the segments waiting in shared memory.
+    max_in_flight = 2 * (jobs or os.cpu_count() or 1)
+    in_flight = collections.deque()
+    with multiprocessing.Pool(jobs, _init_worker, (csv_formatter,)) as pool:
+        try:
+            for chunk in _read_chunks(rows, chunk_size):
+                in_flight.append((chunk, pool.apply_async(_format_chunk, ((fieldnames, chunk, encoding, errors),))))
+                if len(in_flight) >= max_in_flight:
+                    yield from _write_result(*in_flight.popleft(), formatted_file)
+            while in_flight:
+                yield from _write_result(*in_flight.popleft(), formatted_file)
+        finally:
+            # Wait for the chunks that were submitted but not written, when stopping early,
+            # and remove their segments before the pool is terminated.
+            while in_flight:
+                chunk, result = in_flight.popleft()
+                try:
+                    name = result.get()[0]
+                except Exception:
+                    continue
+                _unlink_segment(name)
+
+def format_parallel(csv_formatter, rows, fieldnames, formatted_file, jobs=None, chunk_size=DEFAULT_CHUNK_SIZE, encoding='utf-8', errors='strict'):
+    """
+    Formats the rows with csv_formatter using a pool of jobs worker processes, one per CPU by
+    default.  The formatted rows are encoded with encoding and the errors handler, and written
+    in input order to formatted_file, which must be opened in binary mode.  Returns a generator
+    of the rows that could not be formatted, unmodified and in input order; the rows are
+    formatted as the generator is consumed.  Where shared memory is not supported the rows are
+    formatted in this process instead.
+    """
+    if not isinstance(chunk_size, int) or chunk_size < 1:
+        raise ValueError('The chunk_size parameter must be a positive integer')
+    if jobs is not None and (not isinstance(jobs, int) or jobs < 1):
+        raise ValueError('The jobs parameter must be a positive integer')
+
+    if not SHARED_MEMORY_SUPPORTED:
+        return _format_in_process(csv_formatter, rows, fieldnames, formatted_file, chunk_size, encoding, errors)
+    return _format_in_pool(csv_formatter, rows, fieldnames, formatted_file, jobs, chunk_size, encoding, errors)
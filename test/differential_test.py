@@ -0,0 +1,195 @@
+# Differential tests comparing alternative formatting engines with the reference CsvFormatter.
+#
+# The reference is the final solution in doc/example_fmt.py.  Each engine must produce exactly
+# the same results as the reference for randomly generated values.  When CSVFMT_THROUGHPUT is
+# set, each engine must also keep close to the speedup over the reference recorded for it.
+
+import io
+import os
+import random
+import time
+
+import pytest
+
+from doc.example_fmt import CsvFormatter as ReferenceCsvFormatter
+from src.parallel_fmt import DEFAULT_CHUNK_SIZE, format_parallel
+from test.helpers import format_msg, format_serial
+
+SEED = 20261019
+
+FORMAT_MAP = {'column1': 'default',
+              'column2': 'us_currency',
+              'column3': 'thousands_us_currency',
+              'column4': 'integer',
+              'column5': 'thousands_integer',
+              }
+FIELDNAMES = ['column1', 'column2', 'column3', 'column4', 'column5', 'column6']
+
+EDGE_VALUES = ('', ' ', '0', '-0', '+0', '007', '0.0', '-0.005', '0.005', '0.015', '2.675',
+               '1.', '.5', '-.5', '+3', '--1', '1e3', '1E-2', '-1.5e+10', '1e309', '1e-400',
+               'inf', '-Infinity', 'nan', 'NaN', '1_000', '1__0', '12,345', '0x10', '0b11',
+               ' 12 ', '\t3\n', '12 345', '١٢٣', '１２', '²', 'é', 'ünïcödé', '€5', '$5',
+               '9' * 30, '-' + '9' * 30, '9' * 4300, '9' * 4301, '9' * 400 + '.5',
+               None,
+               )
+
+# The callables that build an alternative CsvFormatter for each record engine, checked method
+# by method against the reference.  There are none yet; src/fmt.py is the exercise solution
+# checked by fmt_test.py, not an engine.  The parallel engine is checked separately against
+# the serial output of the reference.
+RECORD_ENGINES = {}
+
+# The wall clock assertions are unreliable on a loaded machine, so they only run when this
+# environment variable is set.
+THROUGHPUT_VARIABLE = 'CSVFMT_THROUGHPUT'
+
+# The speedup over the reference recorded for each engine and the CPUs it was recorded with.
+# Every engine timed by test_throughput_floors needs an entry.  An engine fails if it falls
+# below THROUGHPUT_MARGIN of its speedup or is slower than the reference.  The parallel
+# speedup is estimated from a single core profile of 20000 rows, which spent 0.08 s in the
+# parent and 0.64 s in the workers against 0.32 s for the reference; re-record it on a
+# machine with PARALLEL_JOBS CPUs.
+PARALLEL_JOBS = 4
+EXPECTED_SPEEDUPS = {'parallel': (1.5, PARALLEL_JOBS),
+                     }
+THROUGHPUT_MARGIN = 0.9
+
+def random_value(rng):
+    """
+    Returns an edge case value or one assembled from random numeric fragments.
+    """
+    if rng.random() < 0.3:
+        return rng.choice(EDGE_VALUES)
+    sign = rng.choice(('', '', '-', '+'))
+    digits = ''.join(rng.choice('0123456789') for i in range(rng.randint(1, 25)))
+    fraction = rng.choice(('', '', '.', '.{:d}'.format(rng.randint(0, 999999))))
+    exponent = rng.choice(('', '', 'e{:d}'.format(rng.randint(-30, 30)), 'E+2'))
+    padding = rng.choice(('', '', ' ', '\t', ' '))
+    suffix = rng.choice(('',) * 10 + ('x', 'ß'))
+    return '{:s}{:s}{:s}{:s}{:s}{:s}{:s}'.format(padding, sign, digits, fraction, exponent, suffix, padding)
+
+def valid_value(rng):
+    """
+    Returns a value that every formatter accepts, so that rows reach the formatted output.
+    """
+    return rng.choice(('', '-', '0')) + ''.join(rng.choice('0123456789') for i in range(rng.randint(1, 18)))
+
+def random_rows(rng, count):
+    """
+    Returns the rows, half of which have random values and half of which only have valid values.
+    """
+    rows = []
+    for i in range(count):
+        make_value = random_value if rng.random() < 0.5 else valid_value
+        rows.append({fieldname: make_value(rng) for fieldname in FIELDNAMES})
+    return rows
+
+def call_or_error(method, value):
+    """
+    Returns the result of the method or the type and message of the exception it raised.
+    """
+    try:
+        return method(value)
+    except Exception as e:
+        return type(e), e.args
+
+def fmt_method_names():
+    return sorted(name for name in dir(ReferenceCsvFormatter) if name.startswith('_fmt_'))
+
+def format_with_parallel(csv_formatter, rows, chunk_size=64, jobs=2):
+    formatted_file = io.BytesIO()
+    rejects = list(format_parallel(csv_formatter, rows, FIELDNAMES, formatted_file, jobs=jobs, chunk_size=chunk_size))
+    return formatted_file.getvalue(), rejects
+
+def available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def best_time(func, *args):
+    times = []
+    for i in range(3):
+        start = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def test_fmt_methods_match_reference():
+    """
+    It should return the same value, or raise the same exception, as the reference for every formatter and value.
+    """
+    if not RECORD_ENGINES:
+        pytest.skip('no alternative record engines registered')
+    rng = random.Random(SEED)
+    values = list(EDGE_VALUES) + [random_value(rng) for i in range(2000)]
+    reference = ReferenceCsvFormatter({})
+    for engine_name, engine in sorted(RECORD_ENGINES.items()):
+        csv_formatter = engine({})
+        for method_name in fmt_method_names():
+            for value in values:
+                expected = call_or_error(getattr(reference, method_name), value)
+                result = call_or_error(getattr(csv_formatter, method_name), value)
+                msg = 'The {:s} engine {:s} method returned {!r} for {!r} but the reference returned {!r} (seed {:d})'.format(engine_name, method_name, result, value, expected, SEED)
+                assert result == expected, format_msg(msg)
+
+def test_format_matches_reference():
+    """
+    It should return the same sorted failures and formatted record as the reference without modifying the original.
+    """
+    if not RECORD_ENGINES:
+        pytest.skip('no alternative record engines registered')
+    rng = random.Random(SEED)
+    rows = random_rows(rng, 2000)
+    reference = ReferenceCsvFormatter(FORMAT_MAP)
+    for engine_name, engine in sorted(RECORD_ENGINES.items()):
+        csv_formatter = engine(FORMAT_MAP)
+        for row in rows:
+            original_row = row.copy()
+            expected = reference.format(row)
+            result = csv_formatter.format(row)
+            msg = 'The {:s} engine returned {!r} for {!r} but the reference returned {!r} (seed {:d})'.format(engine_name, result, row, expected, SEED)
+            assert result == expected, format_msg(msg)
+            msg = 'The {:s} engine modified the original record'.format(engine_name)
+            assert row == original_row, format_msg(msg)
+
+def test_parallel_matches_reference():
+    """
+    It should write byte-identical output and reject the same rows as the serial reference.
+    """
+    rng = random.Random(SEED)
+    rows = random_rows(rng, 2000)
+    reference = ReferenceCsvFormatter(FORMAT_MAP)
+    expected_output, expected_rejects = format_serial(reference, rows, FIELDNAMES)
+    output, rejects = format_with_parallel(reference, rows)
+    msg = 'The parallel output does not match the reference (seed {:d})'.format(SEED)
+    assert output == expected_output, format_msg(msg)
+    msg = 'The parallel rejected rows do not match the reference (seed {:d})'.format(SEED)
+    assert rejects == expected_rejects, format_msg(msg)
+
+@pytest.mark.skipif(not os.getenv(THROUGHPUT_VARIABLE), reason='set {:s}=1 to run the throughput tests'.format(THROUGHPUT_VARIABLE))
+def test_throughput_floors():
+    """
+    It should keep each engine within THROUGHPUT_MARGIN of its recorded speedup and no slower than the reference.
+    """
+    rng = random.Random(SEED)
+    rows = random_rows(rng, 20000)
+    reference = ReferenceCsvFormatter(FORMAT_MAP)
+    engines = {'parallel': lambda: format_with_parallel(reference, rows, DEFAULT_CHUNK_SIZE, PARALLEL_JOBS)}
+    for engine_name, engine in RECORD_ENGINES.items():
+        csv_formatter = engine(FORMAT_MAP)
+        engines[engine_name] = lambda csv_formatter=csv_formatter: format_serial(csv_formatter, rows, FIELDNAMES)
+
+    missing = sorted(engine_name for engine_name in engines if engine_name not in EXPECTED_SPEEDUPS)
+    msg = 'EXPECTED_SPEEDUPS has no entry for the engine(s):  {:s}'.format(', '.join(missing))
+    assert not missing, format_msg(msg)
+
+    timed_engines = sorted(engine_name for engine_name in engines if EXPECTED_SPEEDUPS[engine_name][1] <= available_cpus())
+    if not timed_engines:
+        pytest.skip('the engine speedups were recorded with more than {:d} CPU(s)'.format(available_cpus()))
+
+    reference_time = best_time(format_serial, reference, rows, FIELDNAMES)
+    for engine_name in timed_engines:
+        speedup = reference_time / best_time(engines[engine_name])
+        floor = max(1.0, THROUGHPUT_MARGIN * EXPECTED_SPEEDUPS[engine_name][0])
+        msg = 'The {:s} engine ran at {:.2f} times the reference throughput, below its floor of {:.2f}'.format(engine_name, speedup, floor)
+        assert speedup >= floor, format_msg(msg)
@@ -2,17 +2,14 @@
 
 import os
 import sys
-import textwrap
+
+from test.helpers import format_msg
 
 try:
     from src.fmt import CsvFormatter
 except Exception:
     CsvFormatter = None
 
-def format_msg(msg):
-    lines = '\n'.join(textwrap.wrap(msg))
-    return '\n{:s}'.format(lines)
-
 #The next few tests validate the setup.
 def test_virtualenv():
     """
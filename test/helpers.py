@@ -0,0 +1,25 @@
+# Helpers shared by the test modules.
+
+import csv
+import io
+import textwrap
+
+def format_msg(msg):
+    lines = '\n'.join(textwrap.wrap(msg))
+    return '\n{:s}'.format(lines)
+
+def format_serial(csv_formatter, rows, fieldnames, encoding='utf-8', errors='strict'):
+    """
+    Formats the rows one at a time as scripts/csvfmt.py does and returns the output, encoded with
+    encoding and the errors handler, and the rejected rows.
+    """
+    formatted_file = io.StringIO()
+    writer = csv.DictWriter(formatted_file, fieldnames)
+    rejects = []
+    for row in rows:
+        failed_formats, new_record = csv_formatter.format(row)
+        if failed_formats:
+            rejects.append(row)
+        else:
+            writer.writerow(new_record)
+    return formatted_file.getvalue().encode(encoding, errors), rejects
@@ -0,0 +1,141 @@
+# Tests for formatting CSV rows across worker processes.
+
+import io
+from multiprocessing import shared_memory
+
+from doc.example_fmt import CsvFormatter
+from src import parallel_fmt
+from src.parallel_fmt import _format_in_process, format_parallel
+from test.helpers import format_msg, format_serial
+
+FORMAT_MAP = {'column1': 'integer',
+              'column2': 'thousands_integer',
+              'column3': 'us_currency',
+              }
+FIELDNAMES = ['column1', 'column2', 'column3', 'column4']
+
+def make_rows(count):
+    rows = []
+    for i in range(count):
+        rows.append({'column1': '0{:d}'.format(i) if i % 7 else 'bad',
+                     'column2': '{:d}'.format(i * 1001),
+                     'column3': '{:d}.5'.format(i),
+                     'column4': 'ünmapped {:d}'.format(i),
+                     })
+    return rows
+
+def test_matches_serial():
+    """
+    It should write the same bytes and yield the same rejected rows, in order, as formatting one row at a time.
+    """
+    csv_formatter = CsvFormatter(FORMAT_MAP)
+    rows = make_rows(250)
+    expected_output, expected_rejects = format_serial(csv_formatter, rows, FIELDNAMES)
+
+    formatted_file = io.BytesIO()
+    rejects = list(format_parallel(csv_formatter, rows, FIELDNAMES, formatted_file, jobs=2, chunk_size=16))
+
+    msg = 'The formatted output does not match the output of the serial formatter'
+    assert formatted_file.getvalue() == expected_output, format_msg(msg)
+    msg = 'The rejected rows do not match the rows rejected by the serial formatter'
+    assert rejects == expected_rejects, format_msg(msg)
+
+def test_empty_and_all_rejected():
+    """
+    It should handle input without rows and chunks in which every row is rejected.
+    """
+    csv_formatter = CsvFormatter(FORMAT_MAP)
+    formatted_file = io.BytesIO()
+    rejects = list(format_parallel(csv_formatter, [], FIELDNAMES, formatted_file, jobs=2))
+    msg = 'Nothing should be written or rejected when there are no rows'
+    assert formatted_file.getvalue() == b'' and rejects == [], format_msg(msg)
+
+    rows = [{'column1': 'bad', 'column2': '1', 'column3': '1', 'column4': ''}] * 5
+    rejects = list(format_parallel(csv_formatter, rows, FIELDNAMES, formatted_file, jobs=2, chunk_size=2))
+    msg = 'Every row should be rejected and nothing written'
+    assert formatted_file.getvalue() == b'' and rejects == rows, format_msg(msg)
+
+def test_parameter_value_errors():
+    """
+    It should raise a ValueError when called, before iterating, if the chunk_size or jobs is not a positive integer.
+    """
+    csv_formatter = CsvFormatter(FORMAT_MAP)
+    test_cases = (({'chunk_size': 0}, 'The chunk_size parameter must be a positive integer'),
+                  ({'chunk_size': None}, 'The chunk_size parameter must be a positive integer'),
+                  ({'jobs': 0}, 'The jobs parameter must be a positive integer'),
+                  ({'jobs': -1}, 'The jobs parameter must be a positive integer'),
+                  )
+    for kwargs, expected_message in test_cases:
+        try:
+            format_parallel(csv_formatter, [], FIELDNAMES, io.BytesIO(), **kwargs)
+            msg = 'A ValueError must be raised when called with {!r}'.format(kwargs)
+            assert False, format_msg(msg)
+        except ValueError as e:
+            msg = 'Your message: {:s} != Expected message {:s}'.format(e.args[0], expected_message)
+            assert e.args[0] == expected_message, format_msg(msg)
+
+def test_bounded_and_cleaned_up_when_stopped_early(monkeypatch):
+    """
+    It should only read a few chunks ahead of the writer and remove every segment when the caller stops early.
+    """
+    csv_formatter = CsvFormatter(FORMAT_MAP)
+    rows_read = []
+    def rows():
+        for row in make_rows(5000):
+            rows_read.append(row)
+            yield row
+
+    segment_names = []
+    def record(function):
+        def recorded(name, *args):
+            segment_names.append(name)
+            return function(name, *args)
+        return recorded
+    monkeypatch.setattr(parallel_fmt, '_write_segment', record(parallel_fmt._write_segment))
+    monkeypatch.setattr(parallel_fmt, '_unlink_segment', record(parallel_fmt._unlink_segment))
+
+    rejects = format_parallel(csv_formatter, rows(), FIELDNAMES, io.BytesIO(), jobs=2, chunk_size=10)
+    next(rejects)
+    msg = 'Only {:d} rows should have been read ahead of the writer, but {:d} were read'.format(5 * 10, len(rows_read))
+    assert len(rows_read) <= 5 * 10, format_msg(msg)
+    rejects.close()
+    msg = 'Every chunk submitted to the workers should have had its segment written or removed'
+    assert len(segment_names) == 4, format_msg(msg)
+    for name in segment_names:
+        try:
+            shared_memory.SharedMemory(name=name)
+            msg = 'The shared memory segment {:s} was left behind after stopping early'.format(name)
+            assert False, format_msg(msg)
+        except FileNotFoundError:
+            pass
+
+def test_encoding_errors():
+    """
+    It should encode with the errors handler, so surrogate-escaped input is written back unchanged.
+    """
+    csv_formatter = CsvFormatter(FORMAT_MAP)
+    value = b'\xff 1'.decode('ascii', 'surrogateescape')
+    rows = [{'column1': '1', 'column2': '2', 'column3': '3', 'column4': value}]
+    expected_output, expected_rejects = format_serial(csv_formatter, rows, FIELDNAMES, encoding='ascii', errors='surrogateescape')
+
+    formatted_file = io.BytesIO()
+    rejects = list(format_parallel(csv_formatter, rows, FIELDNAMES, formatted_file, jobs=2, encoding='ascii', errors='surrogateescape'))
+    msg = 'The undecodable input bytes should be written back unchanged'
+    assert formatted_file.getvalue() == expected_output == b'1,2,$3.00,\xff 1\r\n', format_msg(msg)
+    assert rejects == expected_rejects == [], format_msg(msg)
+
+def test_in_process_matches_serial():
+    """
+    It should produce the same output without worker processes where shared memory is not supported.
+    """
+    csv_formatter = CsvFormatter(FORMAT_MAP)
+    rows = make_rows(250)
+    expected_output, expected_rejects = format_serial(csv_formatter, rows, FIELDNAMES)
+
+    formatted_file = io.BytesIO()
+    rejects = list(_format_in_process(csv_formatter, rows, FIELDNAMES, formatted_file, 16, 'utf-8', 'strict'))
+
+    msg = 'The formatted output does not match the output of the serial formatter'
+    assert formatted_file.getvalue() == expected_output, format_msg(msg)
+    msg = 'The rejected rows do not match the rows rejected by the serial formatter'
+    assert rejects == expected_rejects, format_msg(msg)